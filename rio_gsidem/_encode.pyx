@@ -0,0 +1,47 @@
+# cython: boundscheck=False, wraparound=False, cdivision=True, language_level=3
+"""
+Fused C encode loop for rio_gsidem.
+
+Compiled with -O3/-march=native the per-pixel body (scale, round to
+int32, mask to 24 bits, extract three bytes) auto-vectorizes; see
+rio_gsidem.encoders.data_to_rgb for the dispatching numpy fallback.
+"""
+from cython.parallel import prange
+
+from libc.math cimport rint
+
+
+cpdef void encode(
+    double[:, :] data,
+    unsigned char[:, :, :] rgb,
+    double nodata,
+    bint use_nodata,
+):
+    """
+    Encode (rows x cols) float64 data into an interleaved
+    (rows x cols x 3) uint8 RGB buffer in a single pass.
+    """
+    cdef Py_ssize_t rows = data.shape[0]
+    cdef Py_ssize_t cols = data.shape[1]
+    cdef Py_ssize_t i, j
+    cdef double v
+    cdef int xi
+
+    # NOTE: this module is compiled with -ffast-math, which makes NaN
+    # compares and NaN->int conversions formally undefined here; the
+    # caller (data_to_rgb) stamps nodata/NaN pixels after this kernel
+    # returns, and that stamp is what makes NaN input safe.
+    for i in prange(rows, nogil=True):
+        for j in range(cols):
+            v = data[i, j]
+            if use_nodata and v == nodata:
+                rgb[i, j, 0] = 128
+                rgb[i, j, 1] = 0
+                rgb[i, j, 2] = 0
+                continue
+            # rint matches np.rint (ties to even) in the numpy fallback
+            xi = <int>rint(v * 100.0)
+            xi = xi & 0xFFFFFF
+            rgb[i, j, 0] = (xi >> 16) & 0xFF
+            rgb[i, j, 1] = (xi >> 8) & 0xFF
+            rgb[i, j, 2] = xi & 0xFF
@@ -1,8 +1,98 @@
 from __future__ import division
+import threading
+
 import numpy as np
 
+# Codes per unit: the exact reciprocal of the 0.01 encoding interval,
+# so the hot path multiplies instead of dividing
+_SCALE = 100.0
+
+# Conservative per-core L2 budget used to size encode row strips
+_L2_BYTES = 1 << 20
+
+# Per-thread scratch buffers for the numpy path, keyed by strip shape;
+# thread-local storage keeps concurrent windowed encodes from sharing
+# (and corrupting) buffers, and windows recur in a handful of shapes so
+# each cache stays tiny
+_tls = threading.local()
+
+
+def _exact_nodata(nodata, dtype):
+    """
+    Return nodata cast to dtype when exactly representable, else None
+    """
+    try:
+        cast = dtype.type(nodata)
+    except (OverflowError, ValueError):
+        return None
+
+    return cast if cast == nodata else None
+
+
+def _get_scratch(shape):
+    """
+    Return this thread's cached (float64, int32) work buffers for the
+    given shape
+    """
+    cache = getattr(_tls, "scratch", None)
+    if cache is None:
+        cache = _tls.scratch = {}
+    bufs = cache.get(shape)
+    if bufs is None:
+        bufs = (np.empty(shape, np.float64), np.empty(shape, np.int32))
+        cache[shape] = bufs
+    return bufs
+
+try:
+    from rio_gsidem._encode import encode as _c_encode
+except ImportError:
+    _c_encode = None
+
+try:
+    from numba import njit, prange
+
+    _HAS_NUMBA = True
+except ImportError:
+    _HAS_NUMBA = False
+
+
+if _HAS_NUMBA:
+
+    def _make_encoder(scale):
+        """
+        Build a jitted encode kernel with the scale baked in as a
+        compile-time constant, so it folds into an immediate in the
+        generated code rather than being passed per call.
+        """
+
+        @njit(parallel=True, fastmath=True)
+        def _encode_kernel(data, rgb, nodata, use_nodata):
+            # Fused single-pass encode: round each pixel to its 24-bit
+            # code and write the three bytes, parallelized over rows
+            rows, cols = data.shape
+            for i in prange(rows):
+                for j in range(cols):
+                    v = data[i, j]
+                    if use_nodata and v == nodata:
+                        rgb[i, j, 0] = 128
+                        rgb[i, j, 1] = 0
+                        rgb[i, j, 2] = 0
+                        continue
+                    # np.rint keeps ties-to-even parity with the
+                    # numpy fallback and the C extension
+                    xi = int(np.rint(v * scale))
+                    if xi < 0:
+                        xi += 1 << 24
+                    rgb[i, j, 0] = (xi >> 16) & 0xFF
+                    rgb[i, j, 1] = (xi >> 8) & 0xFF
+                    rgb[i, j, 2] = xi & 0xFF
+
+        return _encode_kernel
+
+    _encode_kernel = _make_encoder(_SCALE)
 
-def data_to_rgb(data, nodata=-9999):
+
+def data_to_rgb(data, nodata=-9999, out=None):
     """
     Given an arbitrary (rows x cols) ndarray,
     encode the data into uint8 RGB from an arbitrary
@@ -15,6 +105,10 @@ def data_to_rgb(data, nodata=-9999):
         (rows x cols) ndarray of data to encode
     nodata: float or int, optional
         Value representing nodata in the input array. Default is -9999.
+    out: ndarray, optional
+        uint8 (3 x rows x cols) ndarray to encode into; callers that
+        loop over many windows can reuse one buffer instead of paying
+        an allocation per call. A new array is allocated when omitted.
 
     Returns
     --------
@@ -22,61 +116,132 @@ def data_to_rgb(data, nodata=-9999):
         a uint8 (3 x rows x cols) ndarray with the
         data encoded. Nodata pixels are set to (128, 0, 0).
     """
-    # Replace nodata values with NaN
-    if nodata is not None:
-        data = np.where(data == nodata, np.nan, data)
-    data = data.astype(np.float64)
-
     rows, cols = data.shape
 
-    # Compute the data range, ignoring NaN
-    datarange = np.nanmax(data) - np.nanmin(data)
+    # Work in the input dtype; the scale multiply below upcasts to
+    # float in a single expression, so no standalone float64 copy is
+    # ever made. NaN pixels count as nodata; fold both into one mask
+    # so the hot path never needs NaN handling.
+    if data.dtype.kind == "f":
+        nodata_mask = np.isnan(data)
+        if nodata is not None:
+            nodata_mask |= data == nodata
+        lo, hi = np.inf, -np.inf
+    else:
+        cast = None if nodata is None else _exact_nodata(nodata, data.dtype)
+        if cast is not None:
+            # Compare against a dtype-matched scalar so the mask is a
+            # plain integer equality sweep with no per-element promotion
+            nodata_mask = data == cast
+            info = np.iinfo(data.dtype)
+            lo, hi = info.max, info.min
+        else:
+            # Integer input with no nodata — or a nodata value the
+            # dtype cannot represent — has nothing to mask, so skip
+            # those passes
+            nodata_mask = None
+
+    if nodata_mask is None:
+        datarange = float(data.max()) - float(data.min())
+    else:
+        valid_mask = ~nodata_mask
+        datarange = float(np.max(data, initial=hi, where=valid_mask)) - float(
+            np.min(data, initial=lo, where=valid_mask)
+        )
 
     # Range check
     if datarange > 256 ** 3:
         raise ValueError("Data range of {} is larger than 256 ** 3".format(datarange))
 
-    # Initialize RGB array
-    rgb = np.zeros((3, rows, cols), dtype=np.uint8)
+    # Interleaved (rows, cols, 3) buffer: the three bytes of a pixel
+    # share a cache line; plane-major callers get a zero-copy view.
+    # Every pixel is written below, so np.empty skips the zero fill.
+    if out is None:
+        out = np.moveaxis(np.empty((rows, cols, 3), dtype=np.uint8), 2, 0)
+    rgb = np.moveaxis(out, 0, 2)
 
-    # Handle NaN (nodata) pixels
-    nan_mask = np.isnan(data)  # Mask for NaN values
-    valid_mask = ~nan_mask  # Mask for valid values
+    if _c_encode is not None:
+        # The C loop is typed for float64; other dtypes pay one cast here
+        _c_encode(
+            data if data.dtype == np.float64 else data.astype(np.float64),
+            rgb,
+            0.0 if nodata is None else float(nodata),
+            nodata is not None,
+        )
+    elif _HAS_NUMBA:
+        _encode_kernel(
+            data, rgb, 0.0 if nodata is None else float(nodata), nodata is not None
+        )
+    else:
+        # Weak scalar fill keeps safe in the input dtype
+        safe = data if nodata_mask is None else np.where(nodata_mask, 0, data)
 
-    # Scale data to fit into 24 bits
-    u = 0.01
-    x = np.zeros_like(data, dtype=np.float64)  # Initialize x with zeros
-    x[valid_mask] = data[valid_mask] / u  # Convert valid data to encoded range
+        # Block the pipeline into row strips sized so a strip's float
+        # input plus its uint8 output stays resident in L2; each numpy
+        # sub-op then re-reads cache instead of streaming from DRAM
+        strip = max(1, min(rows, 256, _L2_BYTES // max(cols * 16, 1)))
 
-    # Handle overflow and invalid values
-    x = np.nan_to_num(x, nan=0, posinf=2 ** 24 - 1, neginf=0)  # Replace invalid values
-    x[x < 0] = 0  # Clamp negative values to 0
-    x[x > 2 ** 24 - 1] = 2 ** 24 - 1  # Clamp overflow values to max valid value
+        for i0 in range(0, rows, strip):
+            sl = slice(i0, min(i0 + strip, rows))
+            out_sl = rgb[sl]
+            f64, xi = _get_scratch((sl.stop - i0, cols))
 
-    # Initialize r, g, b
-    r = np.zeros_like(data, dtype=np.uint32)
-    g = np.zeros_like(data, dtype=np.uint32)
-    b = np.zeros_like(data, dtype=np.uint32)
+            # Scale the strip to the 24-bit encoded range; the reused
+            # scratch buffers keep this free of fresh temporaries.
+            # dtype= forces the multiply itself to float64 — without it
+            # float32 input is scaled at float32 precision and can land
+            # one code off from the C/numba kernels.
+            np.multiply(safe[sl], _SCALE, out=f64, dtype=np.float64)
+            np.rint(f64, out=f64)
+            np.copyto(xi, f64, casting="unsafe")
 
-    # Decode RGB components for valid pixels only
-    if np.any(valid_mask):
-        r[valid_mask] = (x[valid_mask] // 2 ** 16).astype(np.uint32)
-        x[valid_mask] -= r[valid_mask] * 2 ** 16
-        g[valid_mask] = (x[valid_mask] // 2 ** 8).astype(np.uint32)
-        x[valid_mask] -= g[valid_mask] * 2 ** 8
-        b[valid_mask] = x[valid_mask].astype(np.uint32)
+            # Masking the low 24 bits of the two's-complement int32
+            # wraps negatives into [2^23, 2^24) with no branch
+            xu = xi.view(np.uint32)
+            np.bitwise_and(xu, np.uint32((1 << 24) - 1), out=xu)
 
-    # Assign to RGB channels
-    rgb[0] = r.astype(np.uint8)
-    rgb[1] = g.astype(np.uint8)
-    rgb[2] = b.astype(np.uint8)
+            # Split the 24-bit code into its three bytes with shifts
+            out_sl[..., 0] = (xu >> 16).astype(np.uint8)
+            out_sl[..., 1] = (xu >> 8).astype(np.uint8)
+            out_sl[..., 2] = xu.astype(np.uint8)
 
-    # Set RGB values for nodata pixels
-    rgb[0][nan_mask] = 128
-    rgb[1][nan_mask] = 0
-    rgb[2][nan_mask] = 0
+    # Stamp nodata pixels in one interleaved write. This stamp is
+    # load-bearing for NaN input: the fastmath C/numba kernels cannot
+    # compare or convert NaN reliably, so NaN pixels are only correct
+    # because they are overwritten here.
+    if nodata_mask is not None:
+        rgb[nodata_mask] = (128, 0, 0)
+
+    return out
+
+def data_to_rgb_batch(stack, nodata=-9999):
+    """
+    Encode a stack of windows in one call, amortizing the per-call
+    dispatch overhead over the whole batch; useful when many small
+    tiles are already held in memory together.
+
+    Parameters
+    -----------
+    stack: ndarray
+        (tiles x rows x cols) ndarray of data to encode
+    nodata: float or int, optional
+        Value representing nodata in the input array. Default is -9999.
+
+    Returns
+    --------
+    ndarray: rgb data
+        a uint8 (tiles x 3 x rows x cols) ndarray with the
+        data encoded. Nodata pixels are set to (128, 0, 0).
+    """
+    tiles, rows, cols = stack.shape
+
+    # Fold the batch into one tall window so the whole stack goes
+    # through a single encode; both reshapes are views for contiguous
+    # input
+    rgb = data_to_rgb(stack.reshape(tiles * rows, cols), nodata=nodata)
+
+    return np.moveaxis(rgb.reshape(3, tiles, rows, cols), 1, 0)
 
-    return rgb
 
 def _decode(rgb):
     """
@@ -93,22 +258,25 @@ def _decode(rgb):
     ndarray: data
         a (rows x cols) ndarray with the data decoded
     """
-    rows, cols = rgb.shape[1:]
+    # Reassemble the 24-bit code in one uint32 buffer, updated in place
+    xu = rgb[0].astype(np.uint32)
+    xu <<= 16
+    xu |= rgb[1].astype(np.uint32) << 8
+    xu |= rgb[2]
 
-    # Initialize the output data array
-    data = np.zeros((rows, cols), dtype=np.float64)
+    # Precompute both masks before reinterpreting the buffer as int32
+    negative_mask = xu >= np.uint32(1 << 23)
+    nodata_mask = xu == np.uint32(1 << 23)
 
-    # Decode the RGB into data
-    u = 0.01
-    data = (rgb[0] * 2 ** 16 + rgb[1] * 2 ** 8 + rgb[2]) * u
+    # Codes at or above 2^23 are wrapped negatives (two's complement)
+    xi = xu.view(np.int32)
+    np.subtract(xi, 1 << 24, out=xi, where=negative_mask)
 
-    # Handle special case for (128, 0, 0)
-    nodata_mask = (rgb[0] == 128) & (rgb[1] == 0) & (rgb[2] == 0)
-    data[nodata_mask] = -9999
+    # Division (not multiply-by-0.01) keeps the decode bit-exact
+    data = xi.astype(np.float64) / _SCALE
 
-    # Handle potential overflow values
-    overflow_mask = data > 2 ** 23
-    data[overflow_mask] = (data[overflow_mask] - (2 ** 24)) * u
+    # Handle special case for (128, 0, 0) == 0x800000, the nodata sentinel
+    data[nodata_mask] = -9999
 
     return data
 
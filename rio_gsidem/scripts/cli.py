@@ -1,19 +1,60 @@
 """rio_gsidem CLI."""
 
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+
 import click
 
 import rasterio as rio
 import numpy as np
-from riomucho import RioMucho
+from rasterio.windows import Window
 import json
 from rasterio.rio.options import creation_options
 
 from rio_gsidem.encoders import data_to_rgb
 from rio_gsidem.mbtiler import RGBTiler
 
+# Rows per work unit for the tif path
+_STRIP_ROWS = 512
+
+# Per-worker state set up by _shm_init
+_shm_state = {}
+
+
+def _shm_init(src_path, shm_name, shape, bidx):
+    """
+    Open the source and attach the shared output array once per worker
+    """
+    _shm_state["src"] = rio.open(src_path)
+    shm = SharedMemory(name=shm_name)
+    _shm_state["shm"] = shm
+    _shm_state["out"] = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+    _shm_state["bidx"] = bidx
+
+
+def _shm_window_worker(window):
+    """
+    Encode one window straight into the shared output array; only the
+    window travels back to the parent, never the RGB payload
+    """
+    band = _shm_state["src"].read(_shm_state["bidx"], window=window)
 
-def _rgb_worker(data, window, ij, g_args):
-    return data_to_rgb(data[0][g_args["bidx"] - 1])
+    view = _shm_state["out"][
+        :,
+        window.row_off : window.row_off + window.height,
+        window.col_off : window.col_off + window.width,
+    ]
+    data_to_rgb(band, out=view)
+
+    return window
+
+
+def _row_windows(rows, cols):
+    """
+    Split a raster into full-width row strips
+    """
+    for row_off in range(0, rows, _STRIP_ROWS):
+        yield Window(0, row_off, cols, min(_STRIP_ROWS, rows - row_off))
 
 
 @click.command("gsidem")
@@ -65,19 +106,51 @@ def gsidem(
     if dst_path.split(".")[-1].lower() == "tif":
         with rio.open(src_path) as src:
             meta = src.profile.copy()
+            rows, cols = src.height, src.width
 
         meta.update(count=3, dtype=np.uint8)
 
         for c in creation_options:
             meta[c] = creation_options[c]
 
-        gargs = {"bidx": bidx}
-
-        with RioMucho(
-            [src_path], dst_path, _rgb_worker, options=meta, global_args=gargs
-        ) as rm:
-
-            rm.run(workers)
+        shape = (3, rows, cols)
+
+        if workers == 1:
+            # Encode inline without shared memory
+            out = np.empty(shape, dtype=np.uint8)
+            with rio.open(src_path) as src:
+                for window in _row_windows(rows, cols):
+                    band = src.read(bidx, window=window)
+                    view = out[
+                        :,
+                        window.row_off : window.row_off + window.height,
+                        window.col_off : window.col_off + window.width,
+                    ]
+                    data_to_rgb(band, out=view)
+
+            with rio.open(dst_path, "w", **meta) as dst:
+                dst.write(out)
+        else:
+            # Workers encode into one shared output array, avoiding the
+            # pickling of each 3-band window back to the parent
+            shm = SharedMemory(create=True, size=3 * rows * cols)
+            try:
+                out = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+
+                mp_ctx = get_context("spawn")
+                with mp_ctx.Pool(
+                    workers, _shm_init, (src_path, shm.name, shape, bidx)
+                ) as pool:
+                    for _ in pool.imap_unordered(
+                        _shm_window_worker, _row_windows(rows, cols)
+                    ):
+                        pass
+
+                with rio.open(dst_path, "w", **meta) as dst:
+                    dst.write(out)
+            finally:
+                shm.close()
+                shm.unlink()
 
     elif dst_path.split(".")[-1].lower() == "mbtiles":
         if min_z is None or max_z is None:
@@ -1,6 +1,24 @@
 """rio-gsidem: setup."""
 
-from setuptools import setup, find_packages
+from setuptools import Extension, setup, find_packages
+
+# Optional C speedup for the encoder; the package falls back to
+# numpy (or numba) when the extension is not built.
+try:
+    from Cython.Build import cythonize
+
+    ext_modules = cythonize(
+        [
+            Extension(
+                "rio_gsidem._encode",
+                ["rio_gsidem/_encode.pyx"],
+                extra_compile_args=["-O3", "-march=native", "-ffast-math", "-fopenmp"],
+                extra_link_args=["-fopenmp"],
+            )
+        ]
+    )
+except ImportError:
+    ext_modules = []
 
 # Parse the version from the fiona module.
 with open("rio_gsidem/__init__.py") as f:
@@ -36,6 +54,7 @@ setup(name="rio-gsidem",
       packages=find_packages(exclude=["ez_setup", "examples", "tests"]),
       include_package_data=True,
       zip_safe=False,
+      ext_modules=ext_modules,
       install_requires=inst_reqs,
       extras_require=extra_reqs,
       entry_points="""
@@ -1,9 +1,26 @@
 from __future__ import division
-from rio_gsidem.encoders import data_to_rgb, _decode, _range_check
+import threading
+
+from rio_gsidem import encoders
+from rio_gsidem.encoders import data_to_rgb, data_to_rgb_batch, _decode, _range_check
 import numpy as np
 import pytest
 
 
+def _each_backend(monkeypatch, func):
+    """
+    Run func() under every available encode backend and return the
+    results in dispatch order (C extension, numba, numpy fallback)
+    """
+    results = [func()]
+    with monkeypatch.context() as m:
+        m.setattr(encoders, "_c_encode", None)
+        results.append(func())
+        m.setattr(encoders, "_HAS_NUMBA", False)
+        results.append(func())
+    return results
+
+
 def test_encode_data_roundtrip():
     minrand, maxrand = np.sort(np.random.randint(-427, 8848, 2))
 
@@ -28,6 +45,69 @@ def test_encode_failrange():
         data_to_rgb(testdata, 0, 1, 0)
 
 
+def test_encode_backends_identical_across_dtypes(monkeypatch):
+    base = np.round(np.random.uniform(-427, 8848, (65, 67)), 2)
+    base[0, 0] = -9999
+
+    for dtype in (np.float64, np.float32, np.int16, np.int32):
+        testdata = base.astype(dtype)
+
+        rgbs = _each_backend(monkeypatch, lambda: data_to_rgb(testdata.copy()))
+
+        for rgb in rgbs[1:]:
+            assert np.array_equal(rgbs[0], rgb)
+
+
+def test_encode_rounds_ties_to_even(monkeypatch):
+    # 0.125 and 0.625 sit exactly on half codes (12.5 and 62.5); every
+    # backend must round them to even like np.rint, not away from zero
+    testdata = np.array([[0.125, 0.625], [-0.125, -0.625]])
+
+    for rgb in _each_backend(monkeypatch, lambda: data_to_rgb(testdata.copy())):
+        assert rgb[2, 0, 0] == 12
+        assert rgb[2, 0, 1] == 62
+        assert np.array_equal(_decode(rgb), np.array([[0.12, 0.62], [-0.12, -0.62]]))
+
+
+def test_encode_threaded_matches_serial(monkeypatch):
+    # The numpy fallback reuses per-thread scratch buffers; concurrent
+    # encodes of same-shape windows must never share them
+    testdata = np.round(np.random.uniform(-427, 8848, (256, 256)), 2)
+    testdata[0, 0] = -9999
+
+    mismatches = []
+
+    with monkeypatch.context() as m:
+        m.setattr(encoders, "_c_encode", None)
+        m.setattr(encoders, "_HAS_NUMBA", False)
+
+        expected = data_to_rgb(testdata.copy())
+
+        def work():
+            for _ in range(20):
+                if not np.array_equal(data_to_rgb(testdata.copy()), expected):
+                    mismatches.append(1)
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    assert not mismatches
+
+
+def test_encode_batch_matches_single():
+    stack = np.round(np.random.uniform(-427, 8848, (4, 64, 64)), 2)
+    stack[0, 0, 0] = -9999
+
+    batched = data_to_rgb_batch(stack)
+
+    assert batched.shape == (4, 3, 64, 64)
+    for tile, rgb in zip(stack, batched):
+        assert np.array_equal(rgb, data_to_rgb(tile))
+
+
 def test_catch_range():
     assert _range_check(256 ** 3 + 1)
     assert not _range_check(256 ** 3 - 1)